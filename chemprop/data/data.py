@@ -247,6 +247,7 @@ class MoleculeDataset(Dataset):
         """
         self._data = data
         self._batch_graph = None
+        self._targets_array = None
         self._random = Random()
 
     def smiles(self, flatten: bool = False) -> Union[List[str], List[List[str]]]:
@@ -395,6 +396,22 @@ class MoleculeDataset(Dataset):
         :return: A list of lists of floats (or None) containing the targets.
         """
         return [d.targets for d in self._data]
+
+    def targets_array(self) -> np.ndarray:
+        """
+        Returns the targets associated with each molecule as a read-only array, with missing targets as NaN.
+
+        The array is built once and reused until the targets are changed with :meth:`set_targets`
+        or :meth:`reset_features_and_targets`. Setting the targets of a single datapoint,
+        as in :code:`dataset[i].set_targets(...)`, does not refresh the array.
+
+        :return: A float64 array of shape (num_molecules, num_tasks) containing the targets.
+        """
+        if self._targets_array is None:
+            self._targets_array = np.array(self.targets(), dtype=np.float64)
+            self._targets_array.setflags(write=False)
+
+        return self._targets_array
     
     def mask(self) -> List[List[bool]]:
         """
@@ -556,11 +573,13 @@ class MoleculeDataset(Dataset):
             )
         for i in range(len(self._data)):
             self._data[i].set_targets(targets[i])
+        self._targets_array = None
 
     def reset_features_and_targets(self) -> None:
         """Resets the features (atom, bond, and molecule) and targets to their raw values."""
         for d in self._data:
             d.reset_features_and_targets()
+        self._targets_array = None
 
     def __len__(self) -> int:
         """
@@ -173,7 +173,7 @@ def predict_and_save(
 
     preds, unc = estimator.calculate_uncertainty(
         calibrator=calibrator
-    )  # preds and unc are lists of shape(data,tasks)
+    )  # preds and unc are lists or arrays of shape(data,tasks)
 
     if args.individual_ensemble_predictions:
         individual_preds = (
@@ -335,6 +335,13 @@ def predict_and_save(
                 for i, evaluation_method in enumerate(args.evaluation_methods):
                     writer.writerow([evaluation_method] + evaluations[i])
 
+    # Regression scaling calibrators return arrays (see UncertaintyCalibrator.apply_calibration),
+    # the returned values are converted to keep the nested list return type
+    if isinstance(preds, np.ndarray):
+        preds = preds.tolist()
+    if isinstance(unc, np.ndarray):
+        unc = unc.tolist()
+
     if return_invalid_smiles:
         full_preds = []
         full_unc = []
@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
 from typing import Iterator, List
+from weakref import WeakKeyDictionary
 
 import numpy as np
 from chemprop.data.data import MoleculeDataLoader
-from scipy.special import erfinv, softmax, logit, expit
-from scipy.optimize import least_squares, fmin
+from joblib import Parallel, cpu_count, delayed
+from scipy.special import ndtri, softmax, logit, expit
+from scipy.optimize import least_squares, fmin, minimize_scalar
 from scipy.stats import t
 from sklearn.isotonic import IsotonicRegression
 
@@ -14,6 +16,24 @@ from chemprop.uncertainty.uncertainty_predictor import build_uncertainty_predict
 from chemprop.multitask_utils import reshape_values
 
 
+# squared z-scores of the calibration data for each task, keyed on the calibration predictor and
+# stored with the targets array they were computed from, so that calibrators built on the same
+# predictor and unchanged targets share them
+_err2_over_var_cache = WeakKeyDictionary()
+
+
+def _task_err2_over_var(uncal_preds, uncal_vars, targets, mask) -> List[np.ndarray]:
+    """
+    Squared errors over variances of the masked values of each task, from task-major
+    predictions, variances, targets and mask.
+    """
+    err2_over_var = []
+    for task_preds, task_vars, task_targs, task_mask in zip(uncal_preds, uncal_vars, targets, mask):
+        task_errors = np.subtract(task_preds[task_mask], task_targs[task_mask], dtype=np.float64)
+        err2_over_var.append(np.square(task_errors) / task_vars[task_mask])
+    return err2_over_var
+
+
 class UncertaintyCalibrator(ABC):
     """
     Uncertainty calibrator class. Subclasses for each uncertainty calibration
@@ -38,6 +58,7 @@ class UncertaintyCalibrator(ABC):
         conformal_alpha: float,
         dropout_sampling_size: int,
         spectra_phase_mask: List[List[bool]],
+        calibration_predictor: UncertaintyPredictor = None,
     ):
         self.calibration_data = calibration_data
         self.calibration_data_loader = calibration_data_loader
@@ -52,21 +73,30 @@ class UncertaintyCalibrator(ABC):
 
         self.raise_argument_errors()
 
-        self.calibration_predictor = build_uncertainty_predictor(
-            test_data=calibration_data,
-            test_data_loader=calibration_data_loader,
-            models=models,
-            scalers=scalers,
-            num_models=num_models,
-            dataset_type=dataset_type,
-            loss_function=loss_function,
-            uncertainty_method=uncertainty_method,
-            uncertainty_dropout_p=uncertainty_dropout_p,
-            conformal_alpha=conformal_alpha,
-            dropout_sampling_size=dropout_sampling_size,
-            individual_ensemble_predictions=False,
-            spectra_phase_mask=spectra_phase_mask,
-        )
+        if calibration_predictor is not None:
+            # reuse predictions already made on the calibration data, skipping the model forward passes
+            if len(calibration_predictor.get_uncal_preds()) != len(calibration_data):
+                raise ValueError(
+                    f"The calibration predictor has predictions for {len(calibration_predictor.get_uncal_preds())} "
+                    f"datapoints but the calibration data has {len(calibration_data)} datapoints."
+                )
+            self.calibration_predictor = calibration_predictor
+        else:
+            self.calibration_predictor = build_uncertainty_predictor(
+                test_data=calibration_data,
+                test_data_loader=calibration_data_loader,
+                models=models,
+                scalers=scalers,
+                num_models=num_models,
+                dataset_type=dataset_type,
+                loss_function=loss_function,
+                uncertainty_method=uncertainty_method,
+                uncertainty_dropout_p=uncertainty_dropout_p,
+                conformal_alpha=conformal_alpha,
+                dropout_sampling_size=dropout_sampling_size,
+                individual_ensemble_predictions=False,
+                spectra_phase_mask=spectra_phase_mask,
+            )
 
         self.calibrate()
 
@@ -98,10 +128,40 @@ class UncertaintyCalibrator(ABC):
         Fit calibration method for the calibration data.
         """
 
+    def _get_err2_over_var(self) -> List[np.ndarray]:
+        """
+        Return the squared z-scores of the regression calibration data for each task. For molecule
+        targets these are reused by calibrators built on the same predictor while the targets are unchanged.
+        """
+        if self.calibration_data.is_atom_bond_targets:
+            mask = np.array(self.calibration_data.mask())
+            uncal_preds = [np.concatenate(x) for x in zip(*self.calibration_predictor.get_uncal_preds())]
+            uncal_vars = [np.concatenate(x) for x in zip(*self.calibration_predictor.get_uncal_vars())]
+            targets = [np.concatenate(x) for x in zip(*self.calibration_data.targets())]
+            return _task_err2_over_var(uncal_preds, uncal_vars, targets, mask)
+
+        # the dataset builds a new targets array whenever its targets are changed
+        targets = self.calibration_data.targets_array()  # shape(data, tasks), missing targets are NaN
+        cached = _err2_over_var_cache.get(self.calibration_predictor)
+        if cached is None or cached[0] is not targets:
+            err2_over_var = _task_err2_over_var(
+                self.calibration_predictor.get_uncal_preds_array().T,  # shape(tasks, data)
+                self.calibration_predictor.get_uncal_vars_array().T,
+                targets.T,
+                ~np.isnan(targets.T),
+            )
+            cached = _err2_over_var_cache[self.calibration_predictor] = (targets, err2_over_var)
+        return cached[1]
+
     @abstractmethod
     def apply_calibration(self, uncal_predictor: UncertaintyPredictor):
         """
         Take in predictions and uncertainty parameters from a model and apply the calibration method using fitted parameters.
+
+        :param uncal_predictor: The predictor holding the uncalibrated predictions and uncertainty parameters.
+        :return: A tuple of the predictions and the calibrated uncertainties, each of shape(data, tasks).
+            The regression scaling calibrators (z-scaling, t-scaling and zelikman interval) return both
+            as new numpy arrays, other calibrators and atom/bond targets return nested lists.
         """
 
     @abstractmethod
@@ -142,58 +202,32 @@ class ZScalingCalibrator(UncertaintyCalibrator):
             raise ValueError("Z Score Scaling is only compatible with regression datasets.")
 
     def calibrate(self):
-        uncal_preds = np.array(self.calibration_predictor.get_uncal_preds())  # shape(data, tasks)
-        uncal_vars = np.array(self.calibration_predictor.get_uncal_vars())
-        targets = np.array(self.calibration_data.targets())
-        mask = np.array(self.calibration_data.mask())
-        self.num_tasks = len(mask)
-        if self.calibration_data.is_atom_bond_targets:
-            uncal_preds = [np.concatenate(x) for x in zip(*uncal_preds)]
-            uncal_vars = [np.concatenate(x) for x in zip(*uncal_vars)]
-            targets = [np.concatenate(x) for x in zip(*targets)]
-        else:
-            uncal_preds = np.array(list(zip(*uncal_preds)))
-            uncal_vars = np.array(list(zip(*uncal_vars)))
-            targets = targets.astype(float)
-            targets = np.array(list(zip(*targets)))
+        err2_over_var = self._get_err2_over_var()
+        self.num_tasks = len(err2_over_var)
         self.scaling = np.zeros(self.num_tasks)
 
         for i in range(self.num_tasks):
-            task_mask = mask[i]
-            task_targets = targets[i][task_mask]
-            task_preds = uncal_preds[i][task_mask]
-            task_vars = uncal_vars[i][task_mask]
-            task_errors = task_preds - task_targets
-            task_zscore = task_errors / np.sqrt(task_vars)
-
-            def objective(scaler_value: float):
-                scaled_vars = task_vars * scaler_value**2
-                nll = np.log(2 * np.pi * scaled_vars) / 2 + (task_errors) ** 2 / (2 * scaled_vars)
-                return nll.sum()
-
-            initial_guess = np.std(task_zscore)
-            sol = fmin(objective, initial_guess)
+            # the gaussian nll is minimized in closed form by the root mean square z-score
+            stdev_scaling = np.sqrt(np.mean(err2_over_var[i]))
 
             if self.regression_calibrator_metric == "stdev":
-                self.scaling[i] = sol
+                self.scaling[i] = stdev_scaling
             else:  # interval
-                self.scaling[i] = sol * erfinv(self.interval_percentile / 100) * np.sqrt(2)
+                self.scaling[i] = stdev_scaling * ndtri(0.5 + self.interval_percentile / 200)
 
     def apply_calibration(self, uncal_predictor: UncertaintyPredictor):
-        uncal_preds = np.array(uncal_predictor.get_uncal_preds())
-        uncal_vars = np.array(uncal_predictor.get_uncal_vars())
         if self.calibration_data.is_atom_bond_targets:
-            cal_stdev = []
-            sqrt_uncal_vars = [
-                [np.sqrt(var) for var in uncal_var] for uncal_var in uncal_vars
+            uncal_preds = np.array(uncal_predictor.get_uncal_preds())
+            cal_stdev = [
+                [np.sqrt(var) * s for var, s in zip(uncal_var, self.scaling)]
+                for uncal_var in uncal_predictor.get_uncal_vars()
             ]
-            for sqrt_uncal_var in sqrt_uncal_vars:
-                scaled_stdev = [var * s for var, s in zip(sqrt_uncal_var, self.scaling)]
-                cal_stdev.append(scaled_stdev)
             return uncal_preds, cal_stdev
         else:
-            cal_stdev = np.sqrt(uncal_vars) * np.expand_dims(self.scaling, axis=0)
-            return uncal_preds.tolist(), cal_stdev.tolist()
+            # scale the square root in place rather than allocating a separate product array
+            cal_stdev = np.sqrt(uncal_predictor.get_uncal_vars_array())
+            np.multiply(cal_stdev, self.scaling, out=cal_stdev)
+            return uncal_predictor.get_uncal_preds_array().copy(), cal_stdev
 
     def nll(
         self,
@@ -229,6 +263,51 @@ class ZScalingCalibrator(UncertaintyCalibrator):
         return nll
 
 
+def _t_scaling_objective(log_scaler_value: float, err2_over_var: np.ndarray, df: int) -> float:
+    """
+    Negative log likelihood of the errors under a t distribution with scale
+    std_error_of_mean * exp(log_scaler_value), keeping only the terms that depend on the
+    scaling value. Working with the log of the scaling value keeps the scale positive without constraints.
+    The squared t-scores over df equal the squared errors over the uncalibrated variances.
+    """
+    ratio = np.exp(-2 * log_scaler_value) * err2_over_var
+    return len(err2_over_var) * log_scaler_value + (df + 1) / 2 * np.sum(np.log1p(ratio))
+
+
+def _t_scaling_grid_nll(log_scaler_grid: np.ndarray, err2_over_var: np.ndarray, df: int) -> np.ndarray:
+    """
+    The t-scaling negative log likelihood, up to terms constant in the scaling value,
+    for every value in a grid of log scaling values, evaluated in a single broadcast.
+    """
+    ratio = np.exp(-2 * log_scaler_grid)[:, np.newaxis] * err2_over_var[np.newaxis, :]  # shape(grid, data)
+    return len(err2_over_var) * log_scaler_grid + (df + 1) / 2 * np.sum(np.log1p(ratio), axis=1)
+
+
+def _fit_t_scaling(err2_over_var: np.ndarray, df: int) -> float:
+    """
+    Fit the t-scaling stdev scaling value for a single task.
+    """
+    # bracket the minimum on a coarse grid from 0.1 to 10 times the root mean square t-score,
+    # where the t-score includes the reduction for number of samples and Bessel's correction
+    log_rms_tscore = 0.5 * np.log(df * np.mean(err2_over_var))
+    log_scaler_grid = log_rms_tscore + np.linspace(np.log(0.1), np.log(10), 50)
+    grid_nll = _t_scaling_grid_nll(log_scaler_grid, err2_over_var, df)
+    best = np.argmin(grid_nll)
+    lower, upper = max(best - 1, 0), min(best + 1, len(log_scaler_grid) - 1)
+    if grid_nll[best] < grid_nll[lower] and grid_nll[best] < grid_nll[upper]:
+        bracket = (log_scaler_grid[lower], log_scaler_grid[best], log_scaler_grid[upper])
+    else:
+        # at the grid edges or on a tie with a neighbour, use the neighbours as a starting interval
+        bracket = (log_scaler_grid[lower], log_scaler_grid[upper])
+    sol = minimize_scalar(
+        _t_scaling_objective,
+        bracket=bracket,
+        args=(err2_over_var, df),
+        method="brent",
+    )
+    return np.exp(sol.x)
+
+
 class TScalingCalibrator(UncertaintyCalibrator):
     """
     A class that calibrates regression uncertainty models using a variation of the
@@ -258,69 +337,39 @@ class TScalingCalibrator(UncertaintyCalibrator):
             raise ValueError("T scaling is intended for use with ensemble models.")
 
     def calibrate(self):
-        uncal_preds = np.array(self.calibration_predictor.get_uncal_preds())  # shape(data, tasks)
-        uncal_vars = np.array(self.calibration_predictor.get_uncal_vars())
-        targets = np.array(self.calibration_data.targets())
-        mask = np.array(self.calibration_data.mask())
-        self.num_tasks = len(mask)
-        if self.calibration_data.is_atom_bond_targets:
-            uncal_preds = [np.concatenate(x) for x in zip(*uncal_preds)]
-            uncal_vars = [np.concatenate(x) for x in zip(*uncal_vars)]
-            targets = [np.concatenate(x) for x in zip(*targets)]
+        err2_over_var = self._get_err2_over_var()
+        self.num_tasks = len(err2_over_var)
+
+        df = self.num_models - 1
+        # frozen distribution, reused for the interval quantile and in nll
+        self._t_dist = t(df=df)
+
+        if self.num_tasks > 1:
+            # tasks are fitted independently, numpy releases the GIL so threads avoid copying the arrays
+            stdev_scaling = Parallel(n_jobs=min(self.num_tasks, cpu_count()), prefer="threads")(
+                delayed(_fit_t_scaling)(err2_over_var[i], df)
+                for i in range(self.num_tasks)
+            )
         else:
-            uncal_preds = np.array(list(zip(*uncal_preds)))
-            uncal_vars = np.array(list(zip(*uncal_vars)))
-            targets = targets.astype(float)
-            targets = np.array(list(zip(*targets)))
-        self.scaling = np.zeros(self.num_tasks)
-
-        for i in range(self.num_tasks):
-            task_mask = mask[i]
-            task_targets = targets[i][task_mask]
-            task_preds = uncal_preds[i][task_mask]
-            task_vars = uncal_vars[i][task_mask]
-            std_error_of_mean = np.sqrt(
-                task_vars / (self.num_models - 1)
-            )  # reduced for number of samples and include Bessel's correction
-            task_errors = task_preds - task_targets
-            task_tscore = task_errors / std_error_of_mean
-
-            def objective(scaler_value: np.ndarray):
-                scaled_std = std_error_of_mean * scaler_value
-                likelihood = t.pdf(
-                    x=task_errors, df=self.num_models - 1, scale=scaled_std
-                )  # scipy t distribution pdf
-                nll = -1 * np.sum(np.log(likelihood), axis=0)
-                return nll
-
-            initial_guess = np.std(task_tscore)
-            stdev_scaling = fmin(objective, initial_guess)
-            if self.regression_calibrator_metric == "stdev":
-                self.scaling[i] = stdev_scaling
-            else:  # interval
-                interval_scaling = stdev_scaling * t.ppf(
-                    (self.interval_percentile / 100 + 1) / 2, df=self.num_models - 1
-                )
-                self.scaling[i] = interval_scaling
+            stdev_scaling = [_fit_t_scaling(err2_over_var[i], df) for i in range(self.num_tasks)]
+        self.scaling = np.array(stdev_scaling)
+        if self.regression_calibrator_metric == "interval":
+            self.scaling *= self._t_dist.ppf((self.interval_percentile / 100 + 1) / 2)
 
     def apply_calibration(self, uncal_predictor: UncertaintyPredictor):
-        uncal_preds = np.array(uncal_predictor.get_uncal_preds())
-        uncal_vars = np.array(uncal_predictor.get_uncal_vars())
+        # fold the standard error of the mean correction into the per-task scaling
+        stdev_scaling = self.scaling / np.sqrt(self.num_models - 1)
         if self.calibration_data.is_atom_bond_targets:
-            cal_stdev = []
-            sqrt_uncal_vars = [
-                [np.sqrt(var / (self.num_models - 1)) for var in uncal_var]
-                for uncal_var in uncal_vars
+            uncal_preds = np.array(uncal_predictor.get_uncal_preds())
+            cal_stdev = [
+                [np.sqrt(var) * s for var, s in zip(uncal_var, stdev_scaling)]
+                for uncal_var in uncal_predictor.get_uncal_vars()
             ]
-            for sqrt_uncal_var in sqrt_uncal_vars:
-                scaled_stdev = [var * s for var, s in zip(sqrt_uncal_var, self.scaling)]
-                cal_stdev.append(scaled_stdev)
             return uncal_preds, cal_stdev
         else:
-            cal_stdev = np.sqrt(uncal_vars / (self.num_models - 1)) * np.expand_dims(
-                self.scaling, axis=0
-            )
-        return uncal_preds.tolist(), cal_stdev.tolist()
+            cal_stdev = np.sqrt(uncal_predictor.get_uncal_vars_array())
+            np.multiply(cal_stdev, stdev_scaling, out=cal_stdev)
+            return uncal_predictor.get_uncal_preds_array().copy(), cal_stdev
 
     def nll(
         self,
@@ -348,13 +397,25 @@ class TScalingCalibrator(UncertaintyCalibrator):
             task_preds = preds[i][task_mask]
             task_targets = targets[i][task_mask]
             task_unc = unc[i][task_mask]
-            task_nll = -1 * t.logpdf(
-                x=task_preds - task_targets, scale=task_unc, df=self.num_models - 1
+            task_nll = np.log(task_unc) - self._t_dist.logpdf(
+                (task_preds - task_targets) / task_unc
             )
             nll.append(task_nll.mean())
         return nll
 
 
+def _partition_percentile(values: np.ndarray, percentile: float) -> float:
+    """
+    Percentile of a 1D array with the same linear interpolation as np.percentile,
+    selecting only the two bracketing order statistics with np.partition instead of sorting.
+    """
+    position = percentile / 100 * (len(values) - 1)
+    lower = int(np.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+    partitioned = np.partition(values, [lower, upper])
+    return partitioned[lower] + (position - lower) * (partitioned[upper] - partitioned[lower])
+
+
 class ZelikmanCalibrator(UncertaintyCalibrator):
     """
     A calibrator for regression datasets that does not depend on a particular probability
@@ -379,54 +440,36 @@ class ZelikmanCalibrator(UncertaintyCalibrator):
             raise ValueError("Crude Scaling is only compatible with regression datasets.")
 
     def calibrate(self):
-        uncal_preds = np.array(self.calibration_predictor.get_uncal_preds())  # shape(data, tasks)
-        uncal_vars = np.array(self.calibration_predictor.get_uncal_vars())
-        targets = np.array(self.calibration_data.targets())
-        mask = np.array(self.calibration_data.mask())
-        self.num_tasks = len(mask)
-        if self.calibration_data.is_atom_bond_targets:
-            uncal_preds = [np.concatenate(x) for x in zip(*uncal_preds)]
-            uncal_vars = [np.concatenate(x) for x in zip(*uncal_vars)]
-            targets = [np.concatenate(x) for x in zip(*targets)]
-        else:
-            uncal_preds = np.array(list(zip(*uncal_preds)))
-            uncal_vars = np.array(list(zip(*uncal_vars)))
-            targets = targets.astype(float)
-            targets = np.array(list(zip(*targets)))
+        err2_over_var = self._get_err2_over_var()
+        self.num_tasks = len(err2_over_var)
         self.histogram_parameters = []
         self.scaling = np.zeros(self.num_tasks)
         for i in range(self.num_tasks):
-            task_mask = mask[i]
-            task_preds = uncal_preds[i][task_mask]
-            task_targets = targets[i][task_mask]
-            task_vars = uncal_vars[i][task_mask]
-            task_preds = np.abs(task_preds - task_targets) / np.sqrt(task_vars)
+            task_abs_zscore = np.sqrt(err2_over_var[i])
             if self.regression_calibrator_metric == "interval":
-                interval_scaling = np.percentile(task_preds, self.interval_percentile)
+                interval_scaling = _partition_percentile(task_abs_zscore, self.interval_percentile)
                 self.scaling[i] = interval_scaling
             else:
-                symmetric_z = np.concatenate([task_preds, -1 * task_preds])
-                std_scaling = np.std(symmetric_z, axis=0)
+                # stdev of the z-scores mirrored about zero, which have zero mean
+                std_scaling = np.sqrt(np.mean(err2_over_var[i]))
                 self.scaling[i] = std_scaling
             # histogram parameters for nll calculation
-            h_params = np.histogram(task_preds, bins="auto", density=True)
+            h_params = np.histogram(task_abs_zscore, bins="auto", density=True)
             self.histogram_parameters.append(h_params)
 
     def apply_calibration(self, uncal_predictor: UncertaintyPredictor):
-        uncal_preds = np.array(uncal_predictor.get_uncal_preds())
-        uncal_vars = np.array(uncal_predictor.get_uncal_vars())
         if self.calibration_data.is_atom_bond_targets:
-            cal_stdev = []
-            sqrt_uncal_vars = [
-                [np.sqrt(var) for var in uncal_var] for uncal_var in uncal_vars
+            uncal_preds = np.array(uncal_predictor.get_uncal_preds())
+            cal_stdev = [
+                [np.sqrt(var) * s for var, s in zip(uncal_var, self.scaling)]
+                for uncal_var in uncal_predictor.get_uncal_vars()
             ]
-            for sqrt_uncal_var in sqrt_uncal_vars:
-                scaled_stdev = [var * s for var, s in zip(sqrt_uncal_var, self.scaling)]
-                cal_stdev.append(scaled_stdev)
             return uncal_preds, cal_stdev
         else:
-            cal_stdev = np.sqrt(uncal_vars) * np.expand_dims(self.scaling, axis=0)
-            return uncal_preds.tolist(), cal_stdev.tolist()
+            # scale the square root in place rather than allocating a separate product array
+            cal_stdev = np.sqrt(uncal_predictor.get_uncal_vars_array())
+            np.multiply(cal_stdev, self.scaling, out=cal_stdev)
+            return uncal_predictor.get_uncal_preds_array().copy(), cal_stdev
 
     def nll(
         self,
@@ -538,7 +581,7 @@ class MVEWeightingCalibrator(UncertaintyCalibrator):
         if self.regression_calibrator_metric == "stdev":
             self.scaling = np.repeat(1, self.num_tasks)
         else:  # interval
-            self.scaling = np.repeat(erfinv(self.interval_percentile / 100) * np.sqrt(2), self.num_tasks)
+            self.scaling = np.repeat(ndtri(0.5 + self.interval_percentile / 200), self.num_tasks)
 
     def apply_calibration(self, uncal_predictor: UncertaintyPredictor):
         uncal_preds = np.array(uncal_predictor.get_uncal_preds())
@@ -1156,10 +1199,17 @@ def build_uncertainty_calibrator(
     conformal_alpha: float,
     dropout_sampling_size: int,
     spectra_phase_mask: List[List[bool]],
+    calibration_predictor: UncertaintyPredictor = None,
 ) -> UncertaintyCalibrator:
     """
     Function that chooses the subclass of :class: `UncertaintyCalibrator`
-    based on the provided arguments and returns that class.
+    based on the provided arguments and returns that class. An existing
+    :class: `UncertaintyPredictor` for the calibration data can be passed as
+    `calibration_predictor` to avoid repeating the model predictions, for
+    instance when several calibrators are built on the same data. The predictor
+    must have been made on `calibration_data`. This is for use through the python
+    API, the command line workflow predicts on a separate test set and so always
+    builds the calibration predictor here.
     """
     if calibration_method is None:
         if dataset_type == "regression":
@@ -1210,5 +1260,6 @@ def build_uncertainty_calibrator(
             conformal_alpha=conformal_alpha,
             dropout_sampling_size=dropout_sampling_size,
             spectra_phase_mask=spectra_phase_mask,
+            calibration_predictor=calibration_predictor,
         )
     return calibrator
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Union
 
 import numpy as np
 from scipy.stats import t, spearmanr
@@ -54,16 +54,17 @@ class UncertaintyEvaluator(ABC):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ) -> List[float]:
         """
         Evaluate the performance of uncertainty predictions against the model target values.
 
         :param targets:  The target values for prediction.
-        :param preds: The prediction values of a model on the test set.
-        :param uncertainties: The estimated uncertainty values, either calibrated or uncalibrated, of a model on the test set.
+        :param preds: The prediction values of a model on the test set, as a nested list or array.
+        :param uncertainties: The estimated uncertainty values, either calibrated or uncalibrated, of a model on the test set,
+            as a nested list or array.
         :param mask: Whether the values in targets were provided.
 
         :return: A list of metric values for each model task.
@@ -78,8 +79,8 @@ class MetricEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         return evaluate_predictions(
@@ -107,8 +108,8 @@ class NLLRegressionEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         if self.calibrator is None:  # uncalibrated regression uncertainties are variances
@@ -149,8 +150,8 @@ class NLLClassEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         targets = np.array(targets, dtype=float)
@@ -184,8 +185,8 @@ class NLLMultiEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         targets = np.array(targets, dtype=int)  # shape(data, tasks)
@@ -220,8 +221,8 @@ class CalibrationAreaEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         targets = np.array(targets, dtype=float)  # shape(data, tasks)
@@ -300,8 +301,8 @@ class ExpectedNormalizedErrorEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         targets = np.array(targets, dtype=float)  # shape(data, tasks)
@@ -377,8 +378,8 @@ class SpearmanEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         targets = np.array(targets, dtype=float)  # shape(data, tasks)
@@ -413,8 +414,8 @@ class ConformalRegressionEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]], # shape (data, tasks)
-        preds: List[List[float]],
-        uncertainties: List[List[float]], # shape (data, 2*tasks)
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray], # shape (data, 2*tasks)
         mask: List[List[bool]],
     ):
         """
@@ -458,8 +459,8 @@ class ConformalMulticlassEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         """
@@ -504,8 +505,8 @@ class ConformalMultilabelEvaluator(UncertaintyEvaluator):
     def evaluate(
         self,
         targets: List[List[float]],
-        preds: List[List[float]],
-        uncertainties: List[List[float]],
+        preds: Union[List[List[float]], np.ndarray],
+        uncertainties: Union[List[List[float]], np.ndarray],
         mask: List[List[bool]],
     ):
         """
@@ -39,6 +39,8 @@ class UncertaintyPredictor(ABC):
         self.loss_function = loss_function
         self.uncal_preds = None
         self.uncal_vars = None
+        self._uncal_preds_array = None
+        self._uncal_vars_array = None
         self.uncal_intervals = None
         self.uncal_confidence = None
         self.individual_vars = None
@@ -84,6 +86,26 @@ class UncertaintyPredictor(ABC):
         """
         return self.uncal_vars
 
+    def get_uncal_preds_array(self) -> np.ndarray:
+        """
+        Return the predicted values for the test data as a contiguous float array,
+        converted once and reused by later calls. Not available for atom/bond targets,
+        whose predictions are ragged.
+        """
+        if self._uncal_preds_array is None:
+            self._uncal_preds_array = np.ascontiguousarray(self.uncal_preds, dtype=np.float64)
+        return self._uncal_preds_array
+
+    def get_uncal_vars_array(self) -> np.ndarray:
+        """
+        Return the uncalibrated variances for the test data as a contiguous float array,
+        converted once and reused by later calls. Not available for atom/bond targets,
+        whose variances are ragged.
+        """
+        if self._uncal_vars_array is None:
+            self._uncal_vars_array = np.ascontiguousarray(self.uncal_vars, dtype=np.float64)
+        return self._uncal_vars_array
+
     def get_uncal_confidence(self):
         """
         Return the uncalibrated confidences for the test data
@@ -39,6 +39,7 @@ setup(
     install_requires=[
         'flask>=1.1.2',
         'hyperopt>=0.2.3',
+        'joblib>=0.14.0',
         'matplotlib>=3.1.3',
         'numpy>=1.18.1',
         'pandas>=1.0.3',
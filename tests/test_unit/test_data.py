@@ -0,0 +1,43 @@
+"""Chemprop unit tests for chemprop/data/data.py"""
+import numpy as np
+import pytest
+
+from chemprop.data import MoleculeDataset, MoleculeDatapoint
+
+
+# Fixtures
+@pytest.fixture
+def dataset():
+    return MoleculeDataset([
+        MoleculeDatapoint(["C"], targets=[1.0, None]),
+        MoleculeDatapoint(["CC"], targets=[2.0, 3.0]),
+    ])
+
+
+# Tests
+def test_targets_array(dataset):
+    """Test that missing targets are NaN in the targets array"""
+    np.testing.assert_array_equal(dataset.targets_array(), [[1.0, np.nan], [2.0, 3.0]])
+
+
+def test_targets_array_cached(dataset):
+    """Test that the targets array is reused and cannot be written to"""
+    targets = dataset.targets_array()
+    assert dataset.targets_array() is targets
+    with pytest.raises(ValueError):
+        targets[0, 0] = 0.0
+
+
+def test_targets_array_set_targets(dataset):
+    """Test that setting the dataset targets refreshes the targets array"""
+    dataset.targets_array()
+    dataset.set_targets([[4.0, 5.0], [None, 6.0]])
+    np.testing.assert_array_equal(dataset.targets_array(), [[4.0, 5.0], [np.nan, 6.0]])
+
+
+def test_targets_array_reset(dataset):
+    """Test that resetting the dataset targets refreshes the targets array"""
+    dataset.set_targets([[4.0, 5.0], [None, 6.0]])
+    dataset.targets_array()
+    dataset.reset_features_and_targets()
+    np.testing.assert_array_equal(dataset.targets_array(), [[1.0, np.nan], [2.0, 3.0]])
@@ -0,0 +1,163 @@
+"""Chemprop unit tests for chemprop/uncertainty/uncertainty_calibrator.py"""
+import numpy as np
+import pytest
+from scipy.optimize import fmin
+from scipy.stats import t
+
+from chemprop.data import MoleculeDataset, MoleculeDatapoint
+from chemprop.uncertainty.uncertainty_calibrator import _fit_t_scaling, _partition_percentile, \
+    build_uncertainty_calibrator
+
+
+class RegressionDataset(MoleculeDataset):
+    """Molecule dataset marked as having no atom or bond targets, as checked by the calibrators"""
+
+    is_atom_bond_targets = False
+
+
+class DummyPredictor:
+    """Predictor with fixed uncalibrated predictions and variances"""
+
+    def __init__(self, preds, variances):
+        self._preds = preds
+        self._vars = variances
+
+    def get_uncal_preds(self):
+        return self._preds.tolist()
+
+    def get_uncal_preds_array(self):
+        return self._preds
+
+    def get_uncal_vars_array(self):
+        return self._vars
+
+
+# Fixtures
+@pytest.fixture
+def regression_calibration_data():
+    rng = np.random.default_rng(0)
+    variances = rng.uniform(0.5, 2, size=(200, 2))
+    preds = rng.normal(size=(200, 2))
+    targets = (preds + 1.5 * np.sqrt(variances) * rng.normal(size=(200, 2))).tolist()
+    targets[0][1] = None
+    calibration_data = RegressionDataset(
+        [MoleculeDatapoint(["C"], targets=datapoint_targets) for datapoint_targets in targets]
+    )
+    return calibration_data, DummyPredictor(preds, variances)
+
+
+def build_regression_calibrator(calibration_method, calibration_data, calibration_predictor):
+    return build_uncertainty_calibrator(
+        calibration_method=calibration_method,
+        uncertainty_method="ensemble",
+        regression_calibrator_metric="stdev",
+        interval_percentile=95,
+        calibration_data=calibration_data,
+        calibration_data_loader=None,
+        models=None,
+        scalers=None,
+        num_models=5,
+        dataset_type="regression",
+        loss_function="mse",
+        uncertainty_dropout_p=0.1,
+        conformal_alpha=0.1,
+        dropout_sampling_size=10,
+        spectra_phase_mask=None,
+        calibration_predictor=calibration_predictor,
+    )
+
+
+# Tests
+@pytest.mark.parametrize("num_values", [1, 2, 7, 101])
+@pytest.mark.parametrize("percentile", [0, 50, 95, 100])
+def test_partition_percentile(num_values, percentile):
+    """Test that the partition based percentile matches np.percentile"""
+    values = np.abs(np.random.default_rng(0).normal(size=num_values))
+    np.testing.assert_allclose(
+        _partition_percentile(values, percentile), np.percentile(values, percentile)
+    )
+
+
+def test_calibration_predictor_reused(regression_calibration_data):
+    """Test that a provided calibration predictor is used for fitting"""
+    calibration_data, calibration_predictor = regression_calibration_data
+    calibrator = build_regression_calibrator("zscaling", calibration_data, calibration_predictor)
+    assert calibrator.calibration_predictor is calibration_predictor
+    assert calibrator.scaling.shape == (2,)
+
+
+def test_calibration_predictor_length_mismatch(regression_calibration_data):
+    """Test that a calibration predictor made on different data is rejected"""
+    calibration_data, calibration_predictor = regression_calibration_data
+    short_data = RegressionDataset(calibration_data[:100])
+    with pytest.raises(ValueError):
+        build_regression_calibrator("zscaling", short_data, calibration_predictor)
+
+
+def test_calibration_arrays_shared(regression_calibration_data):
+    """Test that calibrators built on the same predictor share the squared z-scores"""
+    calibration_data, calibration_predictor = regression_calibration_data
+    zscaling = build_regression_calibrator("zscaling", calibration_data, calibration_predictor)
+    zelikman = build_regression_calibrator("zelikman_interval", calibration_data, calibration_predictor)
+    assert zscaling._get_err2_over_var() is zelikman._get_err2_over_var()
+
+
+def test_calibration_arrays_changed_targets(regression_calibration_data):
+    """Test that calibrators built on the same predictor refit for changed targets or other data"""
+    calibration_data, calibration_predictor = regression_calibration_data
+    zscaling = build_regression_calibrator("zscaling", calibration_data, calibration_predictor)
+    preds = calibration_predictor.get_uncal_preds_array()
+    calibration_data.set_targets((preds + 1).tolist())
+    shifted = build_regression_calibrator("zscaling", calibration_data, calibration_predictor)
+    other_data = RegressionDataset(
+        [MoleculeDatapoint(["C"], targets=datapoint_preds) for datapoint_preds in preds.tolist()]
+    )
+    exact = build_regression_calibrator("zscaling", other_data, calibration_predictor)
+    unit_error_scaling = np.sqrt(np.mean(1 / calibration_predictor.get_uncal_vars_array(), axis=0))
+    np.testing.assert_allclose(shifted.scaling, unit_error_scaling)
+    np.testing.assert_allclose(exact.scaling, 0)
+    assert not np.allclose(zscaling.scaling, shifted.scaling)
+
+
+def test_zscaling_closed_form(regression_calibration_data):
+    """Test that the closed form z-scaling matches a numerical minimum of the normal nll"""
+    calibration_data, calibration_predictor = regression_calibration_data
+    calibrator = build_regression_calibrator("zscaling", calibration_data, calibration_predictor)
+    errors = calibration_predictor.get_uncal_preds_array() - calibration_data.targets_array()
+    variances = calibration_predictor.get_uncal_vars_array()
+    for i in range(2):
+        task_mask = ~np.isnan(errors[:, i])
+        task_errors, task_vars = errors[task_mask, i], variances[task_mask, i]
+
+        def objective(scaler_value):
+            scaled_vars = task_vars * scaler_value**2
+            return np.sum(np.log(2 * np.pi * scaled_vars) / 2 + task_errors**2 / (2 * scaled_vars))
+
+        expected = fmin(objective, 1.0, xtol=1e-10, ftol=1e-10, disp=False)[0]
+        np.testing.assert_allclose(calibrator.scaling[i], expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("num_models", [2, 5, 20])
+@pytest.mark.parametrize("scale", [0.01, 1, 100])
+def test_fit_t_scaling(num_models, scale):
+    """Test that the t-scaling fit matches a numerical minimum of the student's t nll"""
+    rng = np.random.default_rng(0)
+    df = num_models - 1
+    variances = rng.uniform(0.5, 2, size=200)
+    std_error_of_mean = np.sqrt(variances / df)
+    errors = scale * std_error_of_mean * rng.standard_t(df, size=200)
+
+    def objective(scaler_value):
+        return -np.sum(t.logpdf(errors, df=df, scale=std_error_of_mean * scaler_value))
+
+    expected = fmin(objective, np.std(errors / std_error_of_mean), xtol=1e-10, ftol=1e-10, disp=False)[0]
+    np.testing.assert_allclose(_fit_t_scaling(errors**2 / variances, df), expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize("err2_over_var", [[0.3], [2.0, 2.0]])
+def test_fit_t_scaling_grid_tie(err2_over_var):
+    """Test the t-scaling fit when the grid minimum ties with a neighbour"""
+    # with one degree of freedom and equal t-scores the nll is symmetric about the grid centre
+    np.testing.assert_allclose(
+        _fit_t_scaling(np.array(err2_over_var), 1), np.sqrt(err2_over_var[0]), rtol=1e-6
+    )